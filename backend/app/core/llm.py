@@ -1,21 +1,72 @@
 import os
+from typing import AsyncIterator
+
 import httpx
+import orjson
 from dotenv import load_dotenv
 
 load_dotenv()
 
 LLM_MODEL = os.getenv("LLM_MODEL", "llama3.2:3b")
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+# Keep the model (and its prompt-prefix KV cache) resident between requests
+LLM_KEEP_ALIVE = os.getenv("LLM_KEEP_ALIVE", "30m")
+LLM_NUM_CTX = int(os.getenv("LLM_NUM_CTX", "4096"))
+
+
+def create_llm_client() -> httpx.AsyncClient:
+    """
+    Long-lived client so Ollama calls reuse pooled keep-alive connections.
+    HTTP/2 is negotiated via ALPN, so it only kicks in when OLLAMA_URL is
+    https (e.g. behind nginx); plain http stays on HTTP/1.1 keep-alive.
+    """
+    return httpx.AsyncClient(
+        base_url=OLLAMA_URL,
+        http2=True,
+        timeout=httpx.Timeout(connect=5.0, read=None, write=10.0, pool=5.0),
+        limits=httpx.Limits(
+            max_keepalive_connections=32,
+            max_connections=64,
+            keepalive_expiry=300,
+        ),
+    )
+
+
+def _generate_payload(prompt: str, stream: bool) -> dict:
+    return {
+        "model": LLM_MODEL,
+        "prompt": prompt,
+        "stream": stream,
+        "keep_alive": LLM_KEEP_ALIVE,
+        "options": {"num_ctx": LLM_NUM_CTX},
+    }
+
+
+async def ask_llm(client: httpx.AsyncClient, prompt: str) -> str:
+    resp = await client.post(
+        "/api/generate",
+        json=_generate_payload(prompt, stream=False),
+    )
+    resp.raise_for_status()
+    data = resp.json()
+    return data["response"]
+
 
-async def ask_llm(prompt: str) -> str:
-    async with httpx.AsyncClient(timeout=None) as client:
-        resp = await client.post(
-            "http://localhost:11434/api/generate",
-            json={
-                "model": LLM_MODEL,
-                "prompt": prompt,
-                "stream": False,
-            },
-        )
+async def stream_llm(client: httpx.AsyncClient, prompt: str) -> AsyncIterator[str]:
+    """Yield response tokens as Ollama produces them (NDJSON stream)."""
+    async with client.stream(
+        "POST",
+        "/api/generate",
+        json=_generate_payload(prompt, stream=True),
+    ) as resp:
         resp.raise_for_status()
-        data = resp.json()
-        return data["response"]
+        async for line in resp.aiter_lines():
+            if not line:
+                continue
+            chunk = orjson.loads(line)
+            if chunk.get("error"):
+                raise RuntimeError(chunk["error"])
+            if chunk.get("response"):
+                yield chunk["response"]
+            if chunk.get("done"):
+                break
@@ -1,46 +1,47 @@
-import os
 from datetime import datetime
-from typing import List, Literal
+from typing import List, Literal, Tuple
 
-import psycopg2
-from psycopg2.extras import Json
-from dotenv import load_dotenv
-from pathlib import Path
+from psycopg2.extras import Json, execute_values
 
-# Load .env from project root
-BASE_DIR = Path(__file__).resolve().parents[2]
-ENV_PATH = BASE_DIR / ".env"
-load_dotenv(dotenv_path=ENV_PATH)
+from app.db.pool import pool_conn
 
-
-def get_conn():
-    return psycopg2.connect(
-        host=os.getenv("PGHOST", "localhost"),
-        port=os.getenv("PGPORT", "5432"),
-        dbname=os.getenv("PGDATABASE", "rag_db"),
-        user=os.getenv("PGUSER", "rag_user"),
-        password=os.getenv("PGPASSWORD", "rag_pass"),
-    )
+# Set once the schema has been checked, so later calls skip the DDL round-trip
+_table_ready = False
 
 
 def ensure_table():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS chat_messages (
-            id SERIAL PRIMARY KEY,
-            conversation_id TEXT NOT NULL,
-            role TEXT NOT NULL, -- 'user' or 'assistant'
-            content TEXT NOT NULL,
-            metadata JSONB,
-            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-        );
-        """
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    """Create chat_messages if missing. Called once at startup."""
+    global _table_ready
+    with pool_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                id SERIAL PRIMARY KEY,
+                conversation_id TEXT NOT NULL,
+                role TEXT NOT NULL, -- 'user' or 'assistant'
+                content TEXT NOT NULL,
+                metadata JSONB,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+            """
+        )
+        # Lets get_recent_messages read the newest N rows straight off the index
+        cur.execute(
+            """
+            CREATE INDEX IF NOT EXISTS chat_messages_conv_created_idx
+            ON chat_messages (conversation_id, created_at DESC, id DESC);
+            """
+        )
+        conn.commit()
+        cur.close()
+    _table_ready = True
+
+
+def _require_table():
+    """Fallback for callers that skipped app startup (scripts, shells)."""
+    if not _table_ready:
+        ensure_table()
 
 
 def save_message(
@@ -49,39 +50,56 @@ def save_message(
     content: str,
     metadata: dict | None = None,
 ):
-    ensure_table()
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO chat_messages (conversation_id, role, content, metadata)
-        VALUES (%s, %s, %s, %s);
-        """,
-        (conversation_id, role, content, Json(metadata or {})),
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    _require_table()
+    with pool_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            INSERT INTO chat_messages (conversation_id, role, content, metadata)
+            VALUES (%s, %s, %s, %s);
+            """,
+            (conversation_id, role, content, Json(metadata or {})),
+        )
+        conn.commit()
+        cur.close()
+
+
+def save_messages_bulk(
+    rows: List[Tuple[str, Literal["user", "assistant"], str, dict | None]],
+):
+    """Insert several (conversation_id, role, content, metadata) rows in one go."""
+    _require_table()
+    with pool_conn() as conn:
+        cur = conn.cursor()
+        execute_values(
+            cur,
+            """
+            INSERT INTO chat_messages (conversation_id, role, content, metadata)
+            VALUES %s;
+            """,
+            [(c, r, txt, Json(m or {})) for c, r, txt, m in rows],
+        )
+        conn.commit()
+        cur.close()
 
 
 def get_recent_messages(conversation_id: str, limit: int = 6) -> List[dict]:
     """Return last N messages in this conversation, oldest first."""
-    ensure_table()
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT role, content, created_at
-        FROM chat_messages
-        WHERE conversation_id = %s
-        ORDER BY created_at DESC
-        LIMIT %s;
-        """,
-        (conversation_id, limit),
-    )
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    _require_table()
+    with pool_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT role, content, created_at
+            FROM chat_messages
+            WHERE conversation_id = %s
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s;
+            """,
+            (conversation_id, limit),
+        )
+        rows = cur.fetchall()
+        cur.close()
 
     # reverse to oldest -> newest
     rows = rows[::-1]
@@ -0,0 +1,90 @@
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from psycopg2.extensions import connection
+from psycopg2.pool import ThreadedConnectionPool
+from dotenv import load_dotenv
+
+# Load .env from project root
+BASE_DIR = Path(__file__).resolve().parents[2]
+ENV_PATH = BASE_DIR / ".env"
+load_dotenv(dotenv_path=ENV_PATH)
+
+
+class PooledConnection(connection):
+    """Connection that remembers which server-side statements it has PREPAREd."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared: set[str] = set()
+
+
+# putconn() closes a returned connection once minconn are already idle, so
+# minconn defaults to maxconn to keep every opened connection warm.
+POOL_MAX = int(os.getenv("PG_POOL_MAX", "16"))
+POOL_MIN = int(os.getenv("PG_POOL_MIN", str(POOL_MAX)))
+
+_pool: ThreadedConnectionPool | None = None
+# getconn() raises PoolError when all maxconn are checked out; callers wait
+# on this semaphore for a free slot instead.
+_slots: threading.BoundedSemaphore | None = None
+_pool_lock = threading.Lock()
+
+
+def init_pool(
+    minconn: int = POOL_MIN, maxconn: int = POOL_MAX
+) -> ThreadedConnectionPool:
+    """Create the shared connection pool (once per process)."""
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is None:
+            _slots = threading.BoundedSemaphore(maxconn)
+            _pool = ThreadedConnectionPool(
+                minconn=minconn,
+                maxconn=maxconn,
+                host=os.getenv("PGHOST", "localhost"),
+                port=os.getenv("PGPORT", "5432"),
+                dbname=os.getenv("PGDATABASE", "rag_db"),
+                user=os.getenv("PGUSER", "rag_user"),
+                password=os.getenv("PGPASSWORD", "rag_pass"),
+                connection_factory=PooledConnection,
+            )
+    return _pool
+
+
+def close_pool():
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _slots = None
+
+
+@contextmanager
+def pool_conn():
+    """Borrow a connection from the pool (blocking while all are in use)."""
+    pool = _pool or init_pool()
+    slots = _slots
+    with slots:
+        conn = pool.getconn()
+        try:
+            yield conn
+        finally:
+            # putconn rolls back anything left open before reuse
+            pool.putconn(conn)
+
+
+def pool_keeps_connections() -> bool:
+    """True when returned connections are never closed (minconn >= maxconn)."""
+    pool = _pool
+    return pool is not None and pool.minconn >= pool.maxconn
+
+
+def ensure_prepared(conn, cur, name: str, statement: str):
+    """PREPARE name AS statement once per pooled connection."""
+    if name not in conn.prepared:
+        cur.execute(f"PREPARE {name} AS {statement}")
+        conn.prepared.add(name)
@@ -0,0 +1,98 @@
+import os
+
+from psycopg2.extras import Json
+
+from app.db.pool import pool_conn
+
+# Minimum cosine similarity for a cached answer to be reused
+SIMILARITY_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.93"))
+
+
+def ensure_cache_table():
+    """Create response_cache if missing. Called once at startup."""
+    with pool_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS response_cache (
+                id SERIAL PRIMARY KEY,
+                skill_level TEXT NOT NULL,
+                question TEXT NOT NULL,
+                q_emb vector(384) NOT NULL,
+                response JSONB NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                hits INT NOT NULL DEFAULT 0
+            );
+            """
+        )
+        cur.execute(
+            """
+            CREATE INDEX IF NOT EXISTS response_cache_q_emb_hnsw
+            ON response_cache USING hnsw (q_emb vector_cosine_ops);
+            """
+        )
+        conn.commit()
+        cur.close()
+
+
+def lookup_cached_response(
+    skill_level: str,
+    q_emb: list[float],
+    threshold: float = SIMILARITY_THRESHOLD,
+) -> tuple[int, dict] | None:
+    """Return (id, response) for the closest cached question, if similar enough."""
+    with pool_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT id, response, 1 - (q_emb <=> %s::vector) AS sim
+            FROM response_cache
+            WHERE skill_level = %s
+            ORDER BY q_emb <=> %s::vector
+            LIMIT 1;
+            """,
+            (q_emb, skill_level, q_emb),
+        )
+        row = cur.fetchone()
+        if row is None or row[2] < threshold:
+            cur.close()
+            return None
+
+        cache_id, response, _sim = row
+        cur.execute(
+            "UPDATE response_cache SET hits = hits + 1 WHERE id = %s;",
+            (cache_id,),
+        )
+        conn.commit()
+        cur.close()
+    return cache_id, response
+
+
+def store_cached_response(
+    skill_level: str,
+    question: str,
+    q_emb: list[float],
+    response: dict,
+):
+    """Cache an answer; callers pass only fields that validated as AskResponse."""
+    with pool_conn() as conn:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            INSERT INTO response_cache (skill_level, question, q_emb, response)
+            VALUES (%s, %s, %s::vector, %s);
+            """,
+            (skill_level, question, q_emb, Json(response)),
+        )
+        conn.commit()
+        cur.close()
+
+
+def delete_cached_response(cache_id: int):
+    """Drop an entry that can no longer be served (e.g. fails validation)."""
+    with pool_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM response_cache WHERE id = %s;", (cache_id,))
+        conn.commit()
+        cur.close()
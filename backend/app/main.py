@@ -1,15 +1,45 @@
 import re
-import json
-from fastapi import FastAPI, HTTPException
+import sys
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
 from typing import List, Optional
-import json
 import uuid
+import orjson
+from app.rag import embedder
 from app.rag.pg_query import retrieve_context
-from app.core.llm import ask_llm
-from app.db.chat_history import save_message, get_recent_messages
-app = FastAPI(title="RAG Mentor API")
+from app.core.llm import ask_llm, stream_llm, create_llm_client
+from app.db.chat_history import save_messages_bulk, get_recent_messages, ensure_table
+from app.db.pool import init_pool, close_pool
+from app.db.response_cache import (
+    delete_cached_response,
+    ensure_cache_table,
+    lookup_cached_response,
+    store_cached_response,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One shared Ollama client for the whole process (keep-alive + pooling)
+    app.state.llm_client = create_llm_client()
+    # Shared Postgres pool; schema check runs once here, not per request
+    app.state.pg_pool = await asyncio.to_thread(init_pool)
+    await asyncio.to_thread(ensure_table)
+    await asyncio.to_thread(ensure_cache_table)
+    # Load the embedding model now so the first /ask doesn't pay for it
+    await asyncio.to_thread(embedder.load)
+    try:
+        yield
+    finally:
+        await app.state.llm_client.aclose()
+        close_pool()
+
+
+app = FastAPI(title="RAG Mentor API", lifespan=lifespan)
 
 origins = [
     "http://localhost:3000",
@@ -56,6 +86,9 @@ def health():
     return {"status": "ok"}
 
 
+# Character budget for conversation history in the prompt (oldest turns go first)
+MAX_HISTORY_CHARS = 4000
+
 LEVEL_GUIDE = {
     "beginner": """Explain as if to a first-year student.
 - Avoid jargon.
@@ -75,6 +108,75 @@ LEVEL_GUIDE = {
 - You can reference patterns (e.g., SOLID, CQRS, CAP).""",
 }
 
+_TASK_INSTRUCTIONS = """TASK:
+Return a JSON object with exactly these keys:
+- "explanation": string
+- "fixed_code": string
+- "diff": string
+- "steps": array of objects: { "title": string, "detail": string }
+- "tldr": string
+
+IMPORTANT:
+- Respond with VALID JSON only.
+- Do NOT wrap in ```json fences.
+- Do NOT add extra keys.
+"""
+
+# Static head of every prompt, rendered once per skill level. Keeping it
+# first (and byte-identical) lets Ollama reuse the KV cache for it.
+_LEVEL_PREFIX = {
+    level: sys.intern(
+        f"""
+You are a senior software engineering mentor.
+
+User skill level: {level}
+Guidelines: {guide}
+
+{_TASK_INSTRUCTIONS}
+"""
+    )
+    for level, guide in LEVEL_GUIDE.items()
+}
+
+# Leading/trailing markdown fences around the model's JSON
+_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+
+
+def _find_json_object(s: str) -> tuple[int, int, int, bool]:
+    """
+    Single pass over s to locate the first top-level {...} block.
+    Returns (start, end, depth, in_str): end is the index of the matching
+    '}' or -1 if the text stopped early, in which case depth/in_str say
+    what is still open. Braces inside string literals are ignored.
+    """
+    depth = 0
+    in_str = False
+    esc = False
+    start = -1
+    for i, c in enumerate(s):
+        if start == -1:
+            if c == "{":
+                start = i
+                depth = 1
+            continue
+        if in_str:
+            if esc:
+                esc = False
+            elif c == "\\":
+                esc = True
+            elif c == '"':
+                in_str = False
+        elif c == '"':
+            in_str = True
+        elif c == "{":
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                return start, i, 0, False
+    return start, -1, depth, in_str
+
+
 def extract_json(raw: str) -> dict:
     """
     Try to extract a JSON object from the raw LLM output.
@@ -82,120 +184,157 @@ def extract_json(raw: str) -> dict:
     - If there is extra text around the JSON, takes the first {...} block.
     - Tries to fix simple issues like missing closing braces.
     """
-    txt = raw.strip()
-
-    # Remove markdown fences if present
-    if txt.startswith("```"):
-        lines = txt.splitlines()
-        # drop first line (``` or ```json)
-        if lines:
-            lines = lines[1:]
-        # drop last line if it's ``` 
-        if lines and lines[-1].strip().startswith("```"):
-            lines = lines[:-1]
-        txt = "\n".join(lines).strip()
-
-    # If there's extra text, try to isolate the first { ... } block
-    if not txt.startswith("{"):
-        start = txt.find("{")
-        end = txt.rfind("}")
-        if start != -1 and end != -1 and end > start:
-            txt = txt[start : end + 1]
-
-    # If we still don't end with '}', try to balance braces
-    if txt.startswith("{"):
-        open_braces = txt.count("{")
-        close_braces = txt.count("}")
-        if close_braces < open_braces:
-            txt = txt + ("}" * (open_braces - close_braces))
-
-    # Final attempt to parse
-    return json.loads(txt)
-@app.post("/ask", response_model=AskResponse)
-async def ask(req: AskRequest):
-    # 0) Determine conversation ID (new or existing)
-    conversation_id = req.conversation_id or str(uuid.uuid4())
+    txt = _FENCE_RE.sub("", raw)
+
+    start, end, depth, in_str = _find_json_object(txt)
+    if start == -1:
+        raise ValueError("No JSON object found in LLM output")
+
+    if end != -1:
+        return orjson.loads(txt[start : end + 1])
 
-    # 1) Load recent chat history for this conversation
-    history = get_recent_messages(conversation_id, limit=6)
+    # Output was cut off: close any open string and braces, then parse
+    txt = txt[start:].rstrip()
+    if in_str:
+        txt += '"'
+    return orjson.loads(txt + "}" * depth)
 
+
+def _build_prompt(req: AskRequest, history: list[dict], context: str) -> str:
     # Format history into text for the prompt
     history_text_chunks: list[str] = []
     for msg in history:
         role = "User" if msg["role"] == "user" else "Mentor"
         history_text_chunks.append(f"{role}: {msg['content']}")
-    history_text = "\n".join(history_text_chunks)
-
-    # 2) RAG context from docs
-    try:
-        context = retrieve_context(req.question, k=5)
-    except Exception as e:
-        print("Error in retrieve_context:", repr(e))
-        raise HTTPException(status_code=500, detail=f"retrieve_context failed: {e}")
 
-    level_guide = LEVEL_GUIDE.get(req.skill_level, LEVEL_GUIDE["beginner"])
+    # Drop oldest turns until the history fits the budget
+    history_chars = sum(len(c) + 1 for c in history_text_chunks)
+    while len(history_text_chunks) > 1 and history_chars > MAX_HISTORY_CHARS:
+        history_chars -= len(history_text_chunks.pop(0)) + 1
+    history_text = "\n".join(history_text_chunks)[-MAX_HISTORY_CHARS:]
 
-    # 3) Build prompt including history + context
-    prompt = f"""
-You are a senior software engineering mentor.
+    prefix = _LEVEL_PREFIX.get(req.skill_level, _LEVEL_PREFIX["beginner"])
 
-User skill level: {req.skill_level}
-Guidelines: {level_guide}
+    # Per-request data goes after the cached prefix
+    return "".join(
+        [
+            prefix,
+            f"""Context from documentation (may be partial):
+{context}
 
 Conversation so far (may be empty):
 {history_text or "(no previous messages)"}
 
-New user question:
-{req.question}
-
 User code snippet (may be empty):
 {req.code_snippet or "NONE"}
 
 Error message (if any):
 {req.error_message or "NONE"}
 
-Context from documentation (may be partial):
-{context}
-
-TASK:
-Return a JSON object with exactly these keys:
-- "explanation": string
-- "fixed_code": string
-- "diff": string
-- "steps": array of objects: {{ "title": string, "detail": string }}
-- "tldr": string
+New user question:
+{req.question}
+""",
+        ]
+    )
 
-IMPORTANT:
-- Respond with VALID JSON only.
-- Do NOT wrap in ```json fences.
-- Do NOT add extra keys.
-"""
 
-    # 4) Call LLM
-    try:
-        raw = await ask_llm(prompt)
-    except Exception as e:
-        print("Error in ask_llm:", repr(e))
-        raise HTTPException(status_code=500, detail=f"ask_llm failed: {e}")
+async def _prepare(req: AskRequest):
+    """Shared front half of /ask and /ask/stream: history, context, prompt, cache."""
+    # 0) Determine conversation ID (new or existing)
+    conversation_id = req.conversation_id or str(uuid.uuid4())
 
-    # 5) Parse JSON
+    # 1) Load recent chat history and RAG context from docs in parallel
+    # (psycopg2 + the embedder are blocking, so they run in worker threads)
+    history, retrieved = await asyncio.gather(
+        asyncio.to_thread(get_recent_messages, conversation_id, 6),
+        asyncio.to_thread(retrieve_context, req.question, 5),
+        return_exceptions=True,
+    )
+    if isinstance(history, BaseException):
+        raise history
+    if isinstance(retrieved, BaseException):
+        print("Error in retrieve_context:", repr(retrieved))
+        raise HTTPException(status_code=500, detail=f"retrieve_context failed: {retrieved}")
+    context, q_emb = retrieved
+
+    # 2) Build prompt including history + context
+    prompt = _build_prompt(req, history, context)
+
+    # 3) Semantic cache: reuse an answer to a near-identical standalone question.
+    # Follow-ups and questions with code/errors depend on more than the
+    # question text, so those always go to the LLM.
+    cacheable = not (history or req.code_snippet or req.error_message)
+    cached: AskResponse | None = None
+    if cacheable:
+        try:
+            hit = await asyncio.to_thread(
+                lookup_cached_response, req.skill_level, q_emb
+            )
+        except Exception as e:
+            print("Error in response cache lookup:", repr(e))
+            hit = None
+            cacheable = False
+
+        if hit is not None:
+            cache_id, cached_data = hit
+            try:
+                cached = _build_response(cached_data, context, None, conversation_id)
+            except Exception as e:
+                # A bad entry must never be worse than a miss: drop it, ask the LLM
+                print(f"Cached response {cache_id} failed validation:", repr(e))
+                try:
+                    await asyncio.to_thread(delete_cached_response, cache_id)
+                except Exception as del_err:
+                    print("Error deleting cached response:", repr(del_err))
+
+    return conversation_id, context, q_emb, prompt, cacheable, cached
+
+
+def _parse_llm_output(raw: str) -> tuple[dict, bool]:
+    """Return (data, parsed_ok); falls back to the raw text on bad JSON."""
     try:
-        data = extract_json(raw)
+        return extract_json(raw), True
     except Exception as e:
         print("JSON parse failed:", repr(e))
         print("Raw LLM output was:\n", raw)
-        data = {
+        return {
             "explanation": raw,
             "fixed_code": "",
             "diff": "",
             "steps": [],
             "tldr": "Model did not return structured JSON; showing raw answer.",
-        }
+        }, False
+
 
-    explanation = data.get("explanation", "")
-    fixed_code = data.get("fixed_code") or ""
-    diff = data.get("diff") or ""
-    tldr = data.get("tldr", "")
+# Answer fields kept in response_cache; per-request fields are rebuilt on a hit
+_CACHED_FIELDS = {"explanation", "fixed_code", "diff", "steps", "tldr"}
+
+
+async def _store_in_cache(req: AskRequest, q_emb: list[float], resp: AskResponse):
+    """Cache an answer that has already been validated as an AskResponse."""
+    try:
+        await asyncio.to_thread(
+            store_cached_response,
+            req.skill_level,
+            req.question,
+            q_emb,
+            resp.model_dump(include=_CACHED_FIELDS),
+        )
+    except Exception as e:
+        print("Error storing cached response:", repr(e))
+
+
+async def _store_pending_in_cache(
+    req: AskRequest, q_emb: list[float], pending: list[AskResponse]
+):
+    # pending is filled by the streaming generator; empty means nothing to cache
+    for resp in pending:
+        await _store_in_cache(req, q_emb, resp)
+
+
+def _build_response(
+    data: dict, context: str, raw: str | None, conversation_id: str
+) -> AskResponse:
     raw_steps = data.get("steps", [])
 
     steps: list[Step] = []
@@ -207,41 +346,190 @@ IMPORTANT:
             detail = s.get("detail") or ""
             steps.append(Step(title=title, detail=detail))
 
-    # 6) Save user and assistant messages in DB
+    return AskResponse(
+        explanation=data.get("explanation", ""),
+        fixed_code=data.get("fixed_code") or None,
+        diff=data.get("diff") or None,
+        steps=steps,
+        tldr=data.get("tldr", ""),
+        context_used=context,
+        raw=raw,
+        conversation_id=conversation_id,
+    )
+
+
+def _turn_rows(req: AskRequest, resp: AskResponse) -> list[tuple]:
+    """User + assistant rows for save_messages_bulk."""
     user_msg = req.question
     if req.code_snippet:
         user_msg += f"\n\n[Code]\n{req.code_snippet}"
     if req.error_message:
         user_msg += f"\n\n[Error]\n{req.error_message}"
 
-    try:
-        save_message(
-            conversation_id=conversation_id,
-            role="user",
-            content=user_msg,
-            metadata={"skill_level": req.skill_level},
-        )
-        save_message(
-            conversation_id=conversation_id,
-            role="assistant",
-            content=explanation,
-            metadata={
-                "tldr": tldr,
-                "has_fixed_code": bool(fixed_code),
-                "has_diff": bool(diff),
+    return [
+        (
+            resp.conversation_id,
+            "user",
+            user_msg,
+            {"skill_level": req.skill_level},
+        ),
+        (
+            resp.conversation_id,
+            "assistant",
+            resp.explanation,
+            {
+                "tldr": resp.tldr,
+                "has_fixed_code": bool(resp.fixed_code),
+                "has_diff": bool(resp.diff),
             },
-        )
+        ),
+    ]
+
+
+def _save_turn(rows: list[tuple]):
+    # rows may be filled in late (streaming) or stay empty if generation failed
+    if not rows:
+        return
+    try:
+        save_messages_bulk(rows)
     except Exception as e:
         print("Error saving chat messages:", repr(e))
 
+
+@app.post("/ask", response_model=AskResponse)
+async def ask(req: AskRequest, request: Request, background_tasks: BackgroundTasks):
+    conversation_id, context, q_emb, prompt, cacheable, cached = await _prepare(req)
+
+    if cached is not None:
+        resp = cached
+    else:
+        # 4) Call LLM
+        try:
+            raw = await ask_llm(request.app.state.llm_client, prompt)
+        except Exception as e:
+            print("Error in ask_llm:", repr(e))
+            raise HTTPException(status_code=500, detail=f"ask_llm failed: {e}")
+
+        # 5) Parse JSON
+        data, parsed_ok = _parse_llm_output(raw)
+        resp = _build_response(data, context, raw, conversation_id)
+        if parsed_ok and cacheable:
+            background_tasks.add_task(_store_in_cache, req, q_emb, resp)
+
+    # 6) Save user and assistant messages in DB once the response is sent
+    background_tasks.add_task(_save_turn, _turn_rows(req, resp))
+
     # 7) Return response including conversation_id
-    return AskResponse(
-        explanation=explanation,
-        fixed_code=fixed_code or None,
-        diff=diff or None,
-        steps=steps,
-        tldr=tldr,
-        context_used=context,
-        raw=raw,
-        conversation_id=conversation_id,
-    )
+    return resp
+
+
+class _ExplanationStream:
+    """
+    Accumulates streamed LLM tokens and pulls out the decoded text of the
+    "explanation" field as it arrives, so clients can render it early.
+    """
+
+    _KEY_RE = re.compile(r'"explanation"\s*:\s*"')
+
+    def __init__(self):
+        self.raw = ""
+        self._pos = -1  # next unread index inside the explanation string
+        self._done = False
+
+    def feed(self, token: str) -> str:
+        """Add a token; return any newly completed explanation text."""
+        self.raw += token
+        if self._done:
+            return ""
+        if self._pos == -1:
+            m = self._KEY_RE.search(self.raw)
+            if not m:
+                return ""
+            self._pos = m.end()
+
+        buf = self.raw
+        i = end = self._pos
+        while i < len(buf):
+            c = buf[i]
+            if c == "\\":
+                # Wait until the whole escape sequence has arrived
+                width = 6 if buf[i + 1 : i + 2] == "u" else 2
+                if i + width > len(buf):
+                    break
+                i += width
+                end = i
+            elif c == '"':
+                self._done = True
+                break
+            else:
+                i += 1
+                end = i
+
+        segment = buf[self._pos : end]
+        self._pos = end
+        if not segment:
+            return ""
+        try:
+            return orjson.loads(f'"{segment}"')
+        except orjson.JSONDecodeError:
+            # e.g. raw newlines from the model; show it as-is
+            return segment
+
+
+def _ndjson(event: dict) -> bytes:
+    return orjson.dumps(event) + b"\n"
+
+
+@app.post("/ask/stream")
+async def ask_stream(
+    req: AskRequest, request: Request, background_tasks: BackgroundTasks
+):
+    """
+    Same as /ask, but streams NDJSON events while the model generates:
+      {"type": "meta", "conversation_id": ...}
+      {"type": "explanation_delta", "text": ...}   (zero or more)
+      {"type": "final", "response": AskResponse}
+    or {"type": "error", "detail": ...} if generation fails mid-stream.
+    """
+    conversation_id, context, q_emb, prompt, cacheable, cached = await _prepare(req)
+
+    # Filled by the generator once the answer is complete; saved after the
+    # response has been sent.
+    pending_rows: list[tuple] = []
+    pending_cache: list[AskResponse] = []
+    background_tasks.add_task(_save_turn, pending_rows)
+    background_tasks.add_task(_store_pending_in_cache, req, q_emb, pending_cache)
+
+    async def events():
+        yield _ndjson({"type": "meta", "conversation_id": conversation_id})
+
+        if cached is not None:
+            resp = cached
+        else:
+            stream = _ExplanationStream()
+            try:
+                async for token in stream_llm(request.app.state.llm_client, prompt):
+                    delta = stream.feed(token)
+                    if delta:
+                        yield _ndjson({"type": "explanation_delta", "text": delta})
+            except Exception as e:
+                print("Error in stream_llm:", repr(e))
+                yield _ndjson({"type": "error", "detail": f"stream_llm failed: {e}"})
+                return
+
+            data, parsed_ok = _parse_llm_output(stream.raw)
+            try:
+                resp = _build_response(data, context, stream.raw, conversation_id)
+            except ValidationError as e:
+                # JSON parsed but doesn't fit AskResponse (e.g. "tldr": null)
+                print("LLM output failed validation:", repr(e))
+                yield _ndjson({"type": "error", "detail": "LLM output failed validation"})
+                return
+            # Only answers that validated are cached
+            if parsed_ok and cacheable:
+                pending_cache.append(resp)
+
+        pending_rows.extend(_turn_rows(req, resp))
+        yield _ndjson({"type": "final", "response": resp.model_dump()})
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
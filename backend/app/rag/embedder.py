@@ -0,0 +1,105 @@
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+# Use same model everywhere
+MODEL_NAME = "all-MiniLM-L6-v2"
+HF_MODEL_ID = f"sentence-transformers/{MODEL_NAME}"
+MAX_SEQ_LENGTH = 256  # same truncation as the SentenceTransformer config
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+ONNX_DIR = Path(os.getenv("EMBED_ONNX_DIR", BASE_DIR / "models" / f"{MODEL_NAME}-onnx"))
+ONNX_INT8_PATH = ONNX_DIR / "model_int8.onnx"
+
+
+class OnnxEncoder:
+    """
+    int8-quantized MiniLM on onnxruntime: tokenizer -> session.run ->
+    mean pooling -> L2 normalize. Matches SentenceTransformer.encode output.
+    """
+
+    def __init__(self, model_dir: Path, model_path: Path):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = ort.InferenceSession(
+            str(model_path), providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts: list[str], batch_size: int = 64) -> np.ndarray:
+        out = []
+        for i in range(0, len(texts), batch_size):
+            enc = self.tokenizer(
+                texts[i : i + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=MAX_SEQ_LENGTH,
+                return_tensors="np",
+            )
+            feeds = {k: v.astype(np.int64) for k, v in enc.items() if k in self._input_names}
+            hidden = self.session.run(None, feeds)[0]
+
+            mask = enc["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            out.append(pooled.astype(np.float32))
+        if not out:
+            return np.zeros((0, 384), dtype=np.float32)
+        return np.concatenate(out)
+
+
+def _load_encoder():
+    if ONNX_INT8_PATH.exists():
+        print(f"[embedder] Using int8 ONNX model: {ONNX_INT8_PATH}")
+        return OnnxEncoder(ONNX_DIR, ONNX_INT8_PATH), "cpu"
+
+    # Not exported yet (see app/rag/export_onnx.py): use PyTorch
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    print(f"[embedder] Loading embedding model: {MODEL_NAME} on {device}")
+    return SentenceTransformer(MODEL_NAME, device=device), device
+
+
+# One encoder per process, shared by pg_ingest and pg_query. Loaded on first
+# use so importing this module (e.g. from export_onnx) stays cheap.
+_encoder = None
+_device: str | None = None
+_encoder_lock = threading.Lock()
+
+
+def load():
+    """Load the encoder if needed; returns (encoder, device)."""
+    global _encoder, _device
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                _encoder, _device = _load_encoder()
+    return _encoder, _device
+
+
+def encode(
+    texts: list[str],
+    batch_size: int | None = None,
+    show_progress_bar: bool = False,
+) -> np.ndarray:
+    """Embed texts as L2-normalized float32 vectors, shape (len(texts), 384)."""
+    encoder, device = load()
+    if batch_size is None:
+        # Bigger batches keep the GPU busy; CPU saturates earlier
+        batch_size = 128 if device == "cuda" else 64
+
+    if isinstance(encoder, OnnxEncoder):
+        return encoder.encode(texts, batch_size=batch_size)
+    return encoder.encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        show_progress_bar=show_progress_bar,
+        normalize_embeddings=True,
+    )
@@ -0,0 +1,35 @@
+"""
+One-time export of the embedding model to int8 ONNX.
+
+    pip install -r requirements-export.txt
+    python -m app.rag.export_onnx
+
+Writes the tokenizer, model.onnx and model_int8.onnx into ONNX_DIR; once
+model_int8.onnx exists, app.rag.embedder picks it up automatically.
+"""
+from onnxruntime.quantization import QuantType, quantize_dynamic
+from optimum.onnxruntime import ORTModelForFeatureExtraction
+from transformers import AutoTokenizer
+
+from app.rag.embedder import HF_MODEL_ID, ONNX_DIR, ONNX_INT8_PATH
+
+
+def export():
+    ONNX_DIR.mkdir(parents=True, exist_ok=True)
+
+    print(f"[export_onnx] Exporting {HF_MODEL_ID} to {ONNX_DIR}")
+    model = ORTModelForFeatureExtraction.from_pretrained(HF_MODEL_ID, export=True)
+    model.save_pretrained(ONNX_DIR)
+    AutoTokenizer.from_pretrained(HF_MODEL_ID).save_pretrained(ONNX_DIR)
+
+    print(f"[export_onnx] Quantizing weights to int8: {ONNX_INT8_PATH}")
+    quantize_dynamic(
+        model_input=str(ONNX_DIR / "model.onnx"),
+        model_output=str(ONNX_INT8_PATH),
+        weight_type=QuantType.QInt8,
+    )
+    print("[export_onnx] Done.")
+
+
+if __name__ == "__main__":
+    export()
@@ -2,10 +2,11 @@ import os
 from pathlib import Path
 
 import psycopg2
-from psycopg2.extras import Json
-from sentence_transformers import SentenceTransformer
+from psycopg2.extras import Json, execute_values
 from dotenv import load_dotenv
 
+from app.rag import embedder
+
 # --- Load .env from project root explicitly ---
 BASE_DIR = Path(__file__).resolve().parents[2]  # C:\RAG-Mentor
 ENV_PATH = BASE_DIR / ".env"
@@ -16,10 +17,7 @@ print(f"[pg_ingest] Using .env at: {ENV_PATH}")
 DOCS_DIR = BASE_DIR / "docs" / "knowledge_base"
 print(f"[pg_ingest] Docs directory: {DOCS_DIR}")
 
-# Use same model everywhere
-MODEL_NAME = "all-MiniLM-L6-v2"
-print(f"[pg_ingest] Loading embedding model: {MODEL_NAME}")
-model = SentenceTransformer(MODEL_NAME)
+print(f"[pg_ingest] Embedding model: {embedder.MODEL_NAME}")
 
 
 def get_conn():
@@ -55,13 +53,9 @@ def load_docs():
 
 
 def chunk_text(text: str, chunk_size=500, overlap=50):
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunks.append(text[start:end])
-        start = end - overlap
-    return chunks
+    # Precompute window starts once; each chunk is a single slice
+    offsets = range(0, len(text), chunk_size - overlap)
+    return [text[o : o + chunk_size] for o in offsets]
 
 
 def create_table():
@@ -78,14 +72,40 @@ def create_table():
             chunk_index INT NOT NULL,
             content TEXT NOT NULL,
             metadata JSONB,
-            embedding vector(384)
+            embedding halfvec(384)
         );
         """
     )
+    # Older tables stored FP32 vectors; convert them to FP16 in place
+    cur.execute(
+        """
+        SELECT format_type(atttypid, atttypmod)
+        FROM pg_attribute
+        WHERE attrelid = 'documents'::regclass AND attname = 'embedding';
+        """
+    )
+    (col_type,) = cur.fetchone()
+    if col_type != "halfvec(384)":
+        print(f"[pg_ingest] Converting documents.embedding from {col_type} to halfvec(384)...")
+        cur.execute(
+            """
+            ALTER TABLE documents
+            ALTER COLUMN embedding TYPE halfvec(384)
+            USING embedding::halfvec(384);
+            """
+        )
+    # ANN index so top-k queries don't sequentially scan every chunk
+    cur.execute(
+        """
+        CREATE INDEX IF NOT EXISTS documents_embedding_hnsw
+        ON documents USING hnsw (embedding halfvec_l2_ops)
+        WITH (m = 16, ef_construction = 64);
+        """
+    )
     conn.commit()
     cur.close()
     conn.close()
-    print("[pg_ingest] Table 'documents' is ready.")
+    print("[pg_ingest] Table 'documents' and HNSW index are ready.")
 
 
 def ingest():
@@ -99,29 +119,41 @@ def ingest():
     conn = get_conn()
     cur = conn.cursor()
 
-    total_chunks = 0
-
+    # 1) Chunk every doc first so the encoder sees one large batch
+    triples = []
     for doc in docs:
         chunks = chunk_text(doc["text"])
-        embeddings = model.encode(chunks).tolist()
-        print(f"[pg_ingest] Inserting {len(chunks)} chunks from {doc['path']}")
-
-        for idx, (chunk, emb) in enumerate(zip(chunks, embeddings)):
-            cur.execute(
-                """
-                INSERT INTO documents (doc_id, chunk_index, content, metadata, embedding)
-                VALUES (%s, %s, %s, %s, %s)
-                """,
-                (
-                    doc["path"],
-                    idx,
-                    chunk,
-                    Json({"source": doc["path"]}),
-                    emb,
-                ),
-            )
-        total_chunks += len(chunks)
+        print(f"[pg_ingest] Prepared {len(chunks)} chunks from {doc['path']}")
+        for idx, chunk in enumerate(chunks):
+            triples.append((doc["path"], idx, chunk))
+
+    # 2) Single encode call across all chunks
+    embeddings = embedder.encode(
+        [t[2] for t in triples],
+        show_progress_bar=True,
+    ).tolist()
+
+    rows = [
+        (path, idx, chunk, Json({"source": path}), emb)
+        for (path, idx, chunk), emb in zip(triples, embeddings)
+    ]
+
+    # One batched INSERT instead of a round-trip per chunk
+    execute_values(
+        cur,
+        """
+        INSERT INTO documents (doc_id, chunk_index, content, metadata, embedding)
+        VALUES %s
+        """,
+        rows,
+        template="(%s, %s, %s, %s, %s::halfvec)",
+        page_size=500,
+    )
+    total_chunks = len(rows)
 
+    conn.commit()
+    # Refresh planner statistics after the bulk load
+    cur.execute("ANALYZE documents;")
     conn.commit()
     cur.close()
     conn.close()
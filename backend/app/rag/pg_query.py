@@ -1,51 +1,68 @@
-import os
-import psycopg2
-from sentence_transformers import SentenceTransformer
-from dotenv import load_dotenv
+from app.db.pool import ensure_prepared, pool_conn, pool_keeps_connections
+from app.rag import embedder
 
-# Load .env from project root
-load_dotenv()
+# Upper bound on retrieved text sent to the LLM (prefill cost grows with length)
+MAX_CONTEXT_CHARS = 6000
 
-# Use the same embedding model you used in pg_ingest.py
-model = SentenceTransformer("all-MiniLM-L6-v2")
+# Planned once per connection, then run with EXECUTE (skips parse/plan per query)
+_TOP_K_STMT = "retrieve_context_top_k"
+_TOP_K_SQL = """
+    SELECT content
+    FROM documents
+    ORDER BY embedding <-> $1::halfvec
+    LIMIT $2
+"""
+# Same query for connections the pool may close, where a PREPARE would be wasted
+_TOP_K_QUERY = """
+    SELECT content
+    FROM documents
+    ORDER BY embedding <-> %s::halfvec
+    LIMIT %s
+"""
 
 
-def get_conn():
-    """Create a new PostgreSQL connection using env vars."""
-    return psycopg2.connect(
-        host=os.getenv("PGHOST", "localhost"),
-        port=os.getenv("PGPORT", "5432"),
-        dbname=os.getenv("PGDATABASE", "rag_db"),
-        user=os.getenv("PGUSER", "rag_user"),
-        password=os.getenv("PGPASSWORD", "rag_pass"),
-    )
+def embed_question(question: str) -> list[float]:
+    """Embed a single question with the shared model (L2-normalized)."""
+    return embedder.encode([question])[0].tolist()
 
 
-def retrieve_context(question: str, k: int = 5) -> str:
+def retrieve_context(
+    question: str, k: int = 5, max_chars: int = MAX_CONTEXT_CHARS
+) -> tuple[str, list[float]]:
     """
     Given a user question, embed it and retrieve the top-k most similar
     document chunks from the 'documents' table, then join them into one string.
+    Chunks are added best-first until max_chars is reached.
+    Returns the context together with the question embedding so callers can
+    reuse it instead of encoding the question again.
     """
     # 1) Embed the user question
-    q_emb = model.encode([question])[0].tolist()
-
-    # 2) Query pgvector using <-> similarity operator
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT content
-        FROM documents
-        ORDER BY embedding <-> %s::vector
-        LIMIT %s
-        """,
-        (q_emb, k),
-    )
-
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-
-    # 3) Combine contents into one context string
-    chunks = [row[0] for row in rows]
-    return "\n\n".join(chunks)
+    q_emb = embed_question(question)
+
+    # 2) Query pgvector using <-> similarity operator (served by the HNSW index)
+    with pool_conn() as conn:
+        cur = conn.cursor()
+        if pool_keeps_connections():
+            ensure_prepared(conn, cur, _TOP_K_STMT, _TOP_K_SQL)
+            query = f"EXECUTE {_TOP_K_STMT} (%s::halfvec, %s)"
+        else:
+            query = _TOP_K_QUERY
+        # Send the ef_search setting with the query: one round-trip, not two
+        cur.execute(f"SET LOCAL hnsw.ef_search = 40; {query}", (q_emb, k))
+
+        rows = cur.fetchall()
+        cur.close()
+
+    # 3) Combine contents into one context string, dropping the
+    #    lowest-ranked chunks once the budget is spent
+    chunks: list[str] = []
+    used = 0
+    for (content,) in rows:
+        cost = len(content) + (2 if chunks else 0)  # "\n\n" separator
+        if used + cost > max_chars:
+            if not chunks:
+                chunks.append(content[:max_chars])
+            break
+        chunks.append(content)
+        used += cost
+    return "\n\n".join(chunks), q_emb